@@ -1,6 +1,9 @@
+import os
 import cv2
+import numpy as np
 import torch
 from ultralytics import YOLO
+from drawing import draw_labels
 
 try:
     from ultralytics.nn.tasks import DetectionModel
@@ -8,6 +11,12 @@ try:
 except:
     pass
 
+# Numba is optional, the NumPy version below is used without it
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 UTENSIL_CLASSES = {
     'fork': 42,
     'knife': 43,
@@ -17,10 +26,70 @@ UTENSIL_CLASSES = {
     'bottle': 39,
     'wine glass': 46
 }
+UTENSIL_IDS = frozenset(UTENSIL_CLASSES.values())
+ID_TO_NAME = {class_id: name for name, class_id in UTENSIL_CLASSES.items()}
+
+# Capture close to the model's 640 input instead of 1280x720, YOLO would downscale anyway
+CAPTURE_WIDTH = 640
+CAPTURE_HEIGHT = 480
+INFERENCE_SIZE = 640
+DISPLAY_SIZE = None  # e.g. (1280, 720) to upscale only the preview window
+
+UTENSIL_ID_ARRAY = np.array(sorted(UTENSIL_IDS), dtype=np.int32)
+
+def _filter_utensils_numpy(xyxy, confs, cls, utensil_ids):
+    keep = np.isin(cls, utensil_ids)
+    return xyxy[keep], confs[keep], cls[keep]
+
+def _filter_utensils_loop(xyxy, confs, cls, utensil_ids):
+    keep = np.zeros(cls.shape[0], dtype=np.bool_)
+    count = 0
+    for i in range(cls.shape[0]):
+        for utensil_id in utensil_ids:
+            if cls[i] == utensil_id:
+                keep[i] = True
+                count += 1
+                break
+    
+    out_xyxy = np.empty((count, 4), dtype=xyxy.dtype)
+    out_conf = np.empty(count, dtype=confs.dtype)
+    out_cls = np.empty(count, dtype=cls.dtype)
+    j = 0
+    for i in range(cls.shape[0]):
+        if keep[i]:
+            out_xyxy[j] = xyxy[i]
+            out_conf[j] = confs[i]
+            out_cls[j] = cls[i]
+            j += 1
+    return out_xyxy, out_conf, out_cls
+
+# filter_utensils(xyxy, confs, cls, utensil_ids) -> (xyxy, confs, cls) of utensil boxes only
+if njit is not None:
+    filter_utensils = njit(cache=True)(_filter_utensils_loop)
+else:
+    filter_utensils = _filter_utensils_numpy
+
+def load_model(weights):
+    """
+    Load the detector. Without a CUDA GPU the model is exported to ONNX once
+    and run through ONNX Runtime, which is much faster than PyTorch on CPU.
+    """
+    if torch.cuda.is_available():
+        return YOLO(weights)
+    
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    try:
+        if not os.path.exists(onnx_path):
+            print(f"Exporting {weights} to ONNX for CPU inference (one time)...")
+            onnx_path = YOLO(weights).export(format='onnx', opset=12, imgsz=640)
+        return YOLO(onnx_path, task='detect')
+    except Exception as e:
+        print(f"Warning: ONNX export failed ({e}), using PyTorch model")
+        return YOLO(weights)
 
 def main():
     print("Loading YOLOv8 model...")
-    model = YOLO('yolov8n.pt')
+    model = load_model('yolov8n.pt')
     
     print("Opening webcam...")
     cap = cv2.VideoCapture(0)
@@ -29,8 +98,8 @@ def main():
         print("Error: Could not open webcam")
         return
     
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_HEIGHT)
     
     print("Starting detection... Press 'q' to quit")
 
@@ -44,32 +113,26 @@ def main():
             print("Error: Failed to capture frame")
             break
         
-        results = model(frame, conf=0.5, verbose=False)  # conf is confidence threshold
+        results = model(frame, conf=0.5, imgsz=INFERENCE_SIZE, verbose=False)  # conf is confidence threshold
         result = results[0]
         
         utensil_count = {}
+        labels = []
+        
+        boxes = result.boxes.data.cpu().numpy()  # x1, y1, x2, y2, conf, cls per row
+        xyxy, confs, class_ids = filter_utensils(boxes[:, :4].astype(np.int32),
+                                                 boxes[:, -2].astype(np.float32),
+                                                 boxes[:, -1].astype(np.int32),
+                                                 UTENSIL_ID_ARRAY)
         
-        for box in result.boxes:
-            class_id = int(box.cls[0])
-            class_name = result.names[class_id]
-            confidence = float(box.conf[0])
+        for (x1, y1, x2, y2), confidence, class_id in zip(xyxy.tolist(), confs.tolist(), class_ids.tolist()):
+            class_name = ID_TO_NAME[class_id]
+            utensil_count[class_name] = utensil_count.get(class_name, 0) + 1
             
-            if class_name in UTENSIL_CLASSES:
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                
-                utensil_count[class_name] = utensil_count.get(class_name, 0) + 1
-                
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                label = f"{class_name}: {confidence:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                
-                cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (0, 255, 0), -1)
-                
-                cv2.putText(frame, label, (x1, y1 - 5), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            labels.append((x1, y1, f"{class_name}: {confidence:.2f}"))
+        
+        draw_labels(frame, labels, (0, 255, 0), (0, 0, 0))
         
         y_offset = 30
         cv2.putText(frame, "Detected Utensils:", (10, y_offset), 
@@ -81,6 +144,8 @@ def main():
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
             y_offset += 25
         
+        if DISPLAY_SIZE is not None:
+            frame = cv2.resize(frame, DISPLAY_SIZE, interpolation=cv2.INTER_LINEAR)
         cv2.imshow('Utensil Detection - Press Q to quit', frame)
         
         if cv2.waitKey(1) & 0xFF == ord('q'):
@@ -0,0 +1,26 @@
+"""
+Overlay drawing shared by cv.py, pi_client.py and utensil_detector.py
+"""
+
+from functools import lru_cache
+import cv2
+
+@lru_cache(maxsize=1024)
+def label_size(label):
+    """
+    Text size of a box label, cached since labels repeat frame to frame
+    """
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)[0]
+
+def draw_labels(frame, labels, bg_color, text_color):
+    """
+    Draw (x, y, text) labels: the backgrounds first, then the text.
+    Each background is its own filled rectangle, a single fillPoly call
+    would leave the overlap of two labels unfilled (even-odd rule).
+    """
+    for x1, y1, label in labels:
+        w, h = label_size(label)
+        cv2.rectangle(frame, (x1, y1 - h - 10), (x1 + w, y1), bg_color, -1)
+    for x1, y1, label in labels:
+        cv2.putText(frame, label, (x1, y1 - 5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 2)
@@ -0,0 +1,118 @@
+"""
+Model helpers shared by server_mac.py and utensil_detector.py:
+letterboxing and building batched TensorRT engines
+"""
+
+import os
+import json
+import glob
+import cv2
+import numpy as np
+import torch
+
+def letterbox(frame, shape, out=None):
+    """
+    Resize keeping aspect ratio and pad to shape (h, w), centred, grey 114 like Ultralytics
+    Writes into out when given, e.g. a pinned staging buffer.
+    """
+    h, w = frame.shape[:2]
+    r = min(shape[0] / h, shape[1] / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, left = (shape[0] - new_h) // 2, (shape[1] - new_w) // 2
+    if out is None:
+        out = np.empty((shape[0], shape[1], 3), dtype=np.uint8)
+    out.fill(114)
+    out[top:top + new_h, left:left + new_w] = frame
+    return out
+
+def calibration_images(directory):
+    """
+    Image files in directory used to calibrate an INT8 engine, empty if there are none
+    """
+    return sorted(path for ext in ('jpg', 'jpeg', 'png')
+                  for path in glob.glob(os.path.join(directory, f'*.{ext}')))
+
+def build_tensorrt_engine(pt_model, engine_path, imgsz, max_batch, opt_batch=None, int8_images=None):
+    """
+    Build a TensorRT engine that takes batches of 1 to max_batch frames,
+    with kernels tuned for opt_batch (max_batch // 2 by default).
+    Ultralytics 8.0.196 cannot export half=True together with dynamic=True
+    (it traces the FP16 model on the CPU), so an FP32 dynamic ONNX model is
+    exported and TensorRT is asked for FP16 (or INT8) kernels itself.
+    The file gets the Ultralytics metadata header so YOLO() can load it.
+    """
+    import tensorrt as trt
+
+    if opt_batch is None:
+        opt_batch = max(1, max_batch // 2)
+    onnx_path = pt_model.export(format='onnx', imgsz=imgsz, dynamic=True, batch=max_batch, simplify=True)
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    if not parser.parse_from_file(onnx_path):
+        raise RuntimeError(f"Could not parse {onnx_path}")
+
+    config = builder.create_builder_config()
+    input_name = network.get_input(0).name
+    input_shape = (3, imgsz, imgsz)
+    profile = builder.create_optimization_profile()
+    profile.set_shape(input_name, (1, *input_shape), (opt_batch, *input_shape), (max_batch, *input_shape))
+    config.add_optimization_profile(profile)
+    if builder.platform_has_fast_fp16:
+        config.set_flag(trt.BuilderFlag.FP16)
+
+    if int8_images:
+        class ImageCalibrator(trt.IInt8EntropyCalibrator2):
+            """
+            Feeds letterboxed calibration images to TensorRT in max_batch batches
+            """
+            def __init__(self):
+                super().__init__()
+                self.batches = [int8_images[i:i + max_batch]
+                                for i in range(0, len(int8_images) - max_batch + 1, max_batch)]
+                self.device_batch = torch.empty((max_batch, *input_shape), device='cuda')
+
+            def get_batch_size(self):
+                return max_batch
+
+            def get_batch(self, names):
+                if not self.batches:
+                    return None
+                for i, path in enumerate(self.batches.pop(0)):
+                    img = letterbox(cv2.imread(path), (imgsz, imgsz))
+                    rgb = np.ascontiguousarray(img[..., ::-1].transpose(2, 0, 1))
+                    self.device_batch[i] = torch.from_numpy(rgb).to('cuda').float() / 255
+                return [int(self.device_batch.data_ptr())]
+
+            def read_calibration_cache(self):
+                return None
+
+            def write_calibration_cache(self, cache):
+                pass
+
+        # TensorRT calibrates at the profile's opt shape, so calibration gets its own
+        # profile fixed at max_batch to match the batches the calibrator fills
+        calibration_profile = builder.create_optimization_profile()
+        full_batch = (max_batch, *input_shape)
+        calibration_profile.set_shape(input_name, full_batch, full_batch, full_batch)
+        config.set_flag(trt.BuilderFlag.INT8)
+        config.set_calibration_profile(calibration_profile)
+        config.int8_calibrator = ImageCalibrator()
+
+    serialized = builder.build_serialized_network(network, config)
+    if serialized is None:
+        raise RuntimeError("TensorRT engine build failed")
+
+    metadata = {'stride': int(pt_model.model.stride.max()), 'task': pt_model.task, 'batch': max_batch,
+                'imgsz': [imgsz, imgsz], 'names': pt_model.names}
+    if getattr(pt_model.model, 'kpt_shape', None) is not None:
+        metadata['kpt_shape'] = list(pt_model.model.kpt_shape)
+    meta = json.dumps(metadata).encode()
+    with open(engine_path, 'wb') as f:
+        f.write(len(meta).to_bytes(4, byteorder='little', signed=True))
+        f.write(meta)
+        f.write(serialized)
+    return engine_path
@@ -5,26 +5,147 @@ Captures video, sends to server, receives and displays results with voice alerts
 """
 
 import socket
-import pickle
-import struct
 import cv2
 import numpy as np
 import argparse
 import time
+import queue
+import threading
 from collections import defaultdict
 import pyttsx3
+from protocol import (MessageReader, send_message, encode_frame, decode_results, empty_results,
+                      JPEG_QUALITY, H264_VIDEO_PORT, h264_sender_pipeline)
+from drawing import draw_labels
 
-# Classes for reference
-UTENSIL_CLASSES = ['fork', 'knife', 'spoon', 'bowl', 'cup', 'bottle', 'wine glass']
+# COCO class IDs of utensils, the server sends IDs rather than names
+UTENSIL_CLASSES = {
+    'fork': 42,
+    'knife': 43,
+    'spoon': 44,
+    'bowl': 45,
+    'cup': 47,
+    'bottle': 39,
+    'wine glass': 46
+}
+ID_TO_NAME = {class_id: name for name, class_id in UTENSIL_CLASSES.items()}
+
+EMPTY_RESULTS = empty_results()
+ALERT_QUEUE_SIZE = 4
+
+def tts_worker(alert_q):
+    """
+    Speak queued alerts on a background thread, runAndWait() blocks for seconds
+    pyttsx3 engines are not thread safe, so the worker creates and stops its own.
+    """
+    try:
+        tts_engine = pyttsx3.init()
+        tts_engine.setProperty('rate', 150)
+        tts_engine.setProperty('volume', 0.9)
+        print("✓ TTS engine initialized")
+    except Exception as e:
+        # Keep draining the queue so the video loop and shutdown never block on it
+        print(f"⚠️  TTS not available: {e}")
+        tts_engine = None
+    
+    while True:
+        alert_message = alert_q.get()
+        if alert_message is None:
+            break
+        if tts_engine is None:
+            continue
+        try:
+            tts_engine.say(alert_message)
+            tts_engine.runAndWait()
+        except:
+            pass
+    
+    if tts_engine is not None:
+        try:
+            tts_engine.stop()
+        except:
+            pass
+
+class FrameGrabber(threading.Thread):
+    """
+    Captures frames on its own thread so cap.read() overlaps with sending
+    and drawing. Only the newest frame is kept, older ones are dropped.
+    """
+    def __init__(self, cap):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.condition = threading.Condition()
+        self.latest = None
+        self.frame_id = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                print("Failed to capture frame")
+                time.sleep(0.01)
+                continue
+            with self.condition:
+                self.latest = frame
+                self.frame_id += 1
+                self.condition.notify()
+
+    def read(self, last_id=0, timeout=1.0):
+        """
+        Wait for a frame newer than last_id, returns (frame_id, frame)
+        or (last_id, None) on timeout
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id != last_id, timeout)
+            if self.frame_id == last_id:
+                return last_id, None
+            frame, self.latest = self.latest, None
+            return self.frame_id, frame
+
+    def stop(self):
+        self.running = False
+        self.join(timeout=1.0)
+
+class ResultReceiver(threading.Thread):
+    """
+    Background reader for the H.264 mode, where results arrive
+    independently of the frames we send. Keeps only the latest result.
+    """
+    def __init__(self, reader):
+        super().__init__(daemon=True)
+        self.reader = reader
+        self.latest = EMPTY_RESULTS
+        self.closed = False
+
+    def run(self):
+        try:
+            while True:
+                result_data = self.reader.read()
+                if result_data is None:
+                    break
+                self.latest = decode_results(result_data)
+        except Exception as e:
+            print(f"Error receiving results: {e}")
+        self.closed = True
 
 def main():
     parser = argparse.ArgumentParser(description='Raspberry Pi Client for Utensil Detection')
-    parser.add_argument('--server', type=str, required=True, help='Server IP address (your Mac)')
+    parser.add_argument('--server', type=str, default=None, help='Server IP address (your Mac)')
     parser.add_argument('--port', type=int, default=8888, help='Server port (default: 8888)')
+    parser.add_argument('--unix', type=str, default=None, metavar='PATH',
+                        help='Connect over a Unix domain socket when the server runs on this machine')
     parser.add_argument('--camera', type=int, default=0, help='Camera index (default: 0)')
     parser.add_argument('--width', type=int, default=640, help='Frame width (default: 640)')
     parser.add_argument('--height', type=int, default=480, help='Frame height (default: 480)')
+    parser.add_argument('--jpeg-quality', type=int, default=JPEG_QUALITY,
+                        help=f'JPEG quality for frames sent to the server (default: {JPEG_QUALITY})')
+    parser.add_argument('--h264', action='store_true',
+                        help='Stream hardware encoded H.264 over UDP instead of JPEG frames (needs GStreamer)')
+    parser.add_argument('--video-port', type=int, default=H264_VIDEO_PORT,
+                        help=f'UDP port for the H.264 stream (default: {H264_VIDEO_PORT})')
     args = parser.parse_args()
+    if not args.server and not args.unix:
+        parser.error('one of --server or --unix is required')
     
     print("=" * 60)
     print("RASPBERRY PI CLIENT - Utensil Detection")
@@ -32,28 +153,35 @@ def main():
     
     # Initialize text-to-speech engine
     print("\n[1/4] Initializing text-to-speech engine...")
-    try:
-        tts_engine = pyttsx3.init()
-        tts_engine.setProperty('rate', 150)
-        tts_engine.setProperty('volume', 0.9)
-        print("✓ TTS engine initialized")
-    except Exception as e:
-        print(f"⚠️  TTS not available: {e}")
-        tts_engine = None
+    # Alerts are spoken on a worker thread so speech never stalls the video loop
+    alert_q = queue.Queue(maxsize=ALERT_QUEUE_SIZE)
+    tts_thread = threading.Thread(target=tts_worker, args=(alert_q,), daemon=True)
+    tts_thread.start()
     
     # Connect to server
-    print(f"[2/4] Connecting to server at {args.server}:{args.port}...")
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if args.unix:
+        # Server on this machine: skip the TCP/IP stack entirely
+        print(f"[2/4] Connecting to server on {args.unix}...")
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = args.unix
+    else:
+        print(f"[2/4] Connecting to server at {args.server}:{args.port}...")
+        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (args.server, args.port)
     
     try:
-        client_socket.connect((args.server, args.port))
+        client_socket.connect(address)
+        reader = MessageReader(client_socket)
         print(f"✓ Connected to server")
     except Exception as e:
         print(f"❌ Failed to connect: {e}")
         print(f"\nMake sure:")
-        print(f"  1. Server is running on your Mac")
-        print(f"  2. IP address is correct: {args.server}")
-        print(f"  3. Both devices are on the same network")
+        if args.unix:
+            print(f"  1. Server is running with --unix {args.unix}")
+        else:
+            print(f"  1. Server is running on your Mac")
+            print(f"  2. IP address is correct: {args.server}")
+            print(f"  3. Both devices are on the same network")
         return
     
     # Open camera
@@ -78,6 +206,23 @@ def main():
     
     print("✓ Camera opened")
     
+    # Optional hardware H.264 stream, results still come back over TCP
+    video_writer = None
+    result_receiver = None
+    if args.h264:
+        video_host = args.server or '127.0.0.1'
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        video_writer = cv2.VideoWriter(
+            h264_sender_pipeline(video_host, args.video_port, width, height),
+            cv2.CAP_GSTREAMER, 0, 30, (width, height), True)
+        if not video_writer.isOpened():
+            print("❌ Could not open H.264 stream (is OpenCV built with GStreamer?)")
+            return
+        result_receiver = ResultReceiver(reader)
+        result_receiver.start()
+        print(f"✓ Streaming H.264 to {video_host}:{args.video_port}")
+    
     # Tracking variables for unattended utensils
     utensil_first_seen = {}
     last_alert_time = {}
@@ -92,96 +237,81 @@ def main():
     frame_count = 0
     start_time = time.time()
     
+    # Capture runs on its own thread
+    grabber = FrameGrabber(cap)
+    grabber.start()
+    frame_id = 0
+    
     try:
         while True:
-            # Capture frame
-            ret, frame = cap.read()
-            if not ret:
-                print("Failed to capture frame")
+            # Take the newest captured frame
+            frame_id, frame = grabber.read(frame_id)
+            if frame is None:
                 continue
             
-            # Apply software brightness adjustment
-            frame = cv2.convertScaleAbs(frame, alpha=1.2, beta=30)
-            
-            # Serialize frame
-            data = pickle.dumps(frame)
-            message_size = struct.pack("Q", len(data))
-            
-            # Send frame to server
-            try:
-                client_socket.sendall(message_size + data)
-            except Exception as e:
-                print(f"Error sending frame: {e}")
-                break
+            # Apply software brightness adjustment (in place, the grabber hands over a fresh frame)
+            cv2.convertScaleAbs(frame, dst=frame, alpha=1.2, beta=30)
             
-            # Receive results from server
-            try:
-                data = b""
-                payload_size = struct.calcsize("Q")
-                
-                while len(data) < payload_size:
-                    packet = client_socket.recv(4096)
-                    if not packet:
-                        break
-                    data += packet
-                
-                packed_msg_size = data[:payload_size]
-                data = data[payload_size:]
-                msg_size = struct.unpack("Q", packed_msg_size)[0]
-                
-                while len(data) < msg_size:
-                    data += client_socket.recv(4096)
+            if video_writer is not None:
+                # Hand the frame to the hardware encoder and use the latest results
+                video_writer.write(frame)
+                if result_receiver.closed:
+                    print("Server closed the connection")
+                    break
+                results = result_receiver.latest
+            else:
+                # Encode frame as JPEG
+                data = encode_frame(frame, args.jpeg_quality)
                 
-                result_data = data[:msg_size]
-                results = pickle.loads(result_data)
+                # Send frame to server
+                try:
+                    send_message(client_socket, data)
+                except Exception as e:
+                    print(f"Error sending frame: {e}")
+                    break
                 
-            except Exception as e:
-                print(f"Error receiving results: {e}")
-                break
+                # Receive results from server
+                try:
+                    result_data = reader.read()
+                    if result_data is None:
+                        print("Server closed the connection")
+                        break
+                    results = decode_results(result_data)
+                    
+                except Exception as e:
+                    print(f"Error receiving results: {e}")
+                    break
             
             # Process results and draw on frame
             utensil_count = {}
             
             # Draw utensil detections (green boxes)
-            for detection in results['utensils']:
-                class_name = detection['class_name']
-                confidence = detection['confidence']
-                x1, y1, x2, y2 = detection['bbox']
-                
+            utensils = results['utensils']
+            utensil_labels = []
+            for (x1, y1, x2, y2), class_id, confidence in zip(utensils['xyxy'].tolist(),
+                                                              utensils['cls'].tolist(),
+                                                              utensils['conf'].tolist()):
+                class_name = ID_TO_NAME.get(class_id, str(class_id))
                 utensil_count[class_name] = utensil_count.get(class_name, 0) + 1
                 
-                # Draw rectangle
+                # Draw rectangle, the label goes in the batch below
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Draw label
-                label = f"{class_name}: {confidence:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (0, 255, 0), -1)
-                cv2.putText(frame, label, (x1, y1 - 5), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+                utensil_labels.append((x1, y1, f"{class_name}: {confidence:.2f}"))
+            draw_labels(frame, utensil_labels, (0, 255, 0), (0, 0, 0))
             
             # Draw hand detections (blue boxes)
-            hand_count = len(results['hands'])
-            for detection in results['hands']:
-                confidence = detection['confidence']
-                x1, y1, x2, y2 = detection['bbox']
-                
+            hands = results['hands']
+            hand_count = len(hands['conf'])
+            hand_labels = []
+            for (x1, y1, x2, y2), confidence in zip(hands['xyxy'].tolist(), hands['conf'].tolist()):
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                
-                label = f"Hand/Person: {confidence:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (255, 0, 0), -1)
-                cv2.putText(frame, label, (x1, y1 - 5), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+                hand_labels.append((x1, y1, f"Hand/Person: {confidence:.2f}"))
+            draw_labels(frame, hand_labels, (255, 0, 0), (255, 255, 255))
             
-            # Draw keypoints (yellow dots for wrists)
-            for kp_data in results['keypoints']:
-                if kp_data['left_wrist']:
-                    cv2.circle(frame, tuple(kp_data['left_wrist']), 5, (0, 255, 255), -1)
-                if kp_data['right_wrist']:
-                    cv2.circle(frame, tuple(kp_data['right_wrist']), 5, (0, 255, 255), -1)
+            # Draw keypoints (yellow dots for visible wrists)
+            wrists = results['keypoints'].reshape(-1, 2)
+            for x, y in wrists[wrists[:, 0] > 0].tolist():
+                cv2.circle(frame, (x, y), 5, (0, 255, 255), -1)
             
             # Display counts
             y_offset = 30
@@ -237,12 +367,10 @@ def main():
                                 alert_message = f"Warning! {utensil_type} left unattended in sink!"
                                 print(f"🔊 ALERT: {alert_message}")
                                 
-                                if tts_engine:
-                                    try:
-                                        tts_engine.say(alert_message)
-                                        tts_engine.runAndWait()
-                                    except:
-                                        pass
+                                try:
+                                    alert_q.put_nowait(alert_message)
+                                except queue.Full:
+                                    pass  # Already busy speaking, drop this alert
                                 
                                 last_alert_time[utensil_type] = current_time
                             
@@ -285,14 +413,17 @@ def main():
         print(f"\n❌ Error: {e}")
     finally:
         # Cleanup
+        grabber.stop()
         cap.release()
+        if video_writer is not None:
+            video_writer.release()
         cv2.destroyAllWindows()
         client_socket.close()
-        if tts_engine:
-            try:
-                tts_engine.stop()
-            except:
-                pass
+        try:
+            alert_q.put(None, timeout=1.0)
+        except queue.Full:
+            pass  # Worker is stuck, it is a daemon thread so exit anyway
+        tts_thread.join(timeout=5.0)
         print("\n✓ Client stopped")
 
 if __name__ == "__main__":
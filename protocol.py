@@ -0,0 +1,168 @@
+"""
+Wire protocol shared by the Raspberry Pi client and the Mac/PC server
+Every message is an 8 byte length header followed by the payload.
+Frames travel as JPEG bytes, detection results as packed NumPy arrays.
+
+Detection results are a struct of arrays:
+    {
+        'utensils': {'cls': int8[N], 'conf': float16[N], 'xyxy': int16[N, 4]},
+        'hands': {'conf': float16[M], 'xyxy': int16[M, 4]},
+        'keypoints': int16[K, 2, 2]  # left/right wrist (x, y) per person, 0 when not visible
+    }
+"""
+
+import struct
+import cv2
+import numpy as np
+
+HEADER = struct.Struct("Q")
+RESULTS_HEADER = struct.Struct("<HHH")  # utensil, hand and keypoint counts
+JPEG_QUALITY = 80
+RECV_CHUNK_SIZE = 65536
+
+def send_message(sock, payload):
+    """
+    Send one length-prefixed message
+    payload can be any bytes-like object (bytes, a uint8 array). Where
+    sendmsg exists the header and payload go out without being joined.
+    """
+    view = memoryview(payload).cast('B')
+    header = HEADER.pack(view.nbytes)
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(header + view.tobytes())
+        return
+    
+    buffers = [memoryview(header), view]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        # Drop what was fully sent and slice into a partially sent buffer
+        while buffers and sent >= buffers[0].nbytes:
+            sent -= buffers[0].nbytes
+            buffers.pop(0)
+        if sent:
+            buffers[0] = buffers[0][sent:]
+
+class MessageReader:
+    """
+    Reads length-prefixed messages from a socket, keeping any extra
+    bytes received so the next message can be parsed from the buffer
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.data = b""
+
+    def read_buffered(self):
+        """
+        Return the next message if it is already fully buffered, otherwise None
+        """
+        if len(self.data) < HEADER.size:
+            return None
+        msg_size = HEADER.unpack(self.data[:HEADER.size])[0]
+        end = HEADER.size + msg_size
+        if len(self.data) < end:
+            return None
+        payload = self.data[HEADER.size:end]
+        self.data = self.data[end:]
+        return payload
+
+    def read(self):
+        """
+        Block until a full message arrives, returns None if the peer disconnected
+        """
+        while True:
+            payload = self.read_buffered()
+            if payload is not None:
+                return payload
+            packet = self.sock.recv(RECV_CHUNK_SIZE)
+            if not packet:
+                return None
+            self.data += packet
+
+def encode_frame(frame, quality=JPEG_QUALITY):
+    """
+    Encode a BGR frame as JPEG, returns the encoded uint8 array
+    (bytes-like, so it can be sent without a copy to bytes)
+    """
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not JPEG encode frame")
+    return buf
+
+def decode_frame(payload):
+    """
+    Decode JPEG bytes back into a BGR frame
+    """
+    frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode JPEG frame")
+    return frame
+
+def empty_results():
+    """
+    Detection results with nothing detected
+    """
+    return {
+        'utensils': {'cls': np.zeros(0, np.int8), 'conf': np.zeros(0, np.float16),
+                     'xyxy': np.zeros((0, 4), np.int16)},
+        'hands': {'conf': np.zeros(0, np.float16), 'xyxy': np.zeros((0, 4), np.int16)},
+        'keypoints': np.zeros((0, 2, 2), np.int16)
+    }
+
+def encode_results(results):
+    """
+    Pack a detection results dict: counts header, then each array's raw bytes
+    """
+    utensils, hands, keypoints = results['utensils'], results['hands'], results['keypoints']
+    arrays = [
+        np.asarray(utensils['cls'], '<i1'),
+        np.asarray(utensils['conf'], '<f2'),
+        np.asarray(utensils['xyxy'], '<i2'),
+        np.asarray(hands['conf'], '<f2'),
+        np.asarray(hands['xyxy'], '<i2'),
+        np.asarray(keypoints, '<i2'),
+    ]
+    header = RESULTS_HEADER.pack(len(utensils['cls']), len(hands['conf']), len(keypoints))
+    return header + b"".join(array.tobytes() for array in arrays)
+
+def decode_results(payload):
+    """
+    Unpack a detection results dict, the arrays are views into payload
+    """
+    n_utensils, n_hands, n_keypoints = RESULTS_HEADER.unpack_from(payload, 0)
+    offset = RESULTS_HEADER.size
+    
+    def take(dtype, shape):
+        nonlocal offset
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.zeros(shape, dtype)
+        array = np.frombuffer(payload, dtype, count, offset).reshape(shape)
+        offset += array.nbytes
+        return array
+    
+    return {
+        'utensils': {'cls': take('<i1', (n_utensils,)), 'conf': take('<f2', (n_utensils,)),
+                     'xyxy': take('<i2', (n_utensils, 4))},
+        'hands': {'conf': take('<f2', (n_hands,)), 'xyxy': take('<i2', (n_hands, 4))},
+        'keypoints': take('<i2', (n_keypoints, 2, 2))
+    }
+
+# Optional H.264/RTP video path (needs OpenCV built with GStreamer).
+# Frames go over UDP, results still come back over the TCP connection.
+H264_VIDEO_PORT = 5000
+
+def h264_sender_pipeline(host, port, width, height, fps=30):
+    """
+    GStreamer pipeline for cv2.VideoWriter that hardware encodes on the Pi
+    """
+    return (f"appsrc ! videoconvert ! video/x-raw,format=I420,width={width},height={height},framerate={fps}/1 "
+            f"! v4l2h264enc ! video/x-h264,level=(string)4 ! h264parse "
+            f"! rtph264pay config-interval=1 pt=96 ! udpsink host={host} port={port} sync=false")
+
+def h264_receiver_pipeline(port):
+    """
+    GStreamer pipeline for cv2.VideoCapture that decodes the Pi's stream
+    """
+    return (f"udpsrc port={port} caps=application/x-rtp,media=video,encoding-name=H264,payload=96 "
+            f"! rtph264depay ! avdec_h264 ! videoconvert ! video/x-raw,format=BGR "
+            f"! appsink drop=true max-buffers=1 sync=false")
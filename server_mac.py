@@ -5,13 +5,22 @@ Receives frames from Raspberry Pi, processes them, and sends back results
 """
 
 import socket
-import pickle
-import struct
+import argparse
 import cv2
 import torch
 from ultralytics import YOLO
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
 import time
+import os
+import stat
+import math
+import queue
+import threading
 import numpy as np
+from protocol import (MessageReader, send_message, decode_frame, encode_results,
+                      RECV_CHUNK_SIZE, H264_VIDEO_PORT, h264_receiver_pipeline)
+from inference import letterbox, calibration_images, build_tensorrt_engine
 
 # Fix for PyTorch 2.6+ compatibility with YOLOv8
 # Add all necessary classes to safe globals
@@ -47,179 +56,696 @@ UTENSIL_CLASSES = {
     'bottle': 39,
     'wine glass': 46
 }
+UTENSIL_IDS = frozenset(UTENSIL_CLASSES.values())
 
-def process_frame(frame, model, pose_model):
+# Inference settings
+INFERENCE_SIZE = 640
+USE_TENSORRT = True  # Use pre-exported TensorRT engines when a CUDA GPU is available
+TENSORRT_INT8 = False  # INT8 needs calibration images, FP16 is used otherwise
+INT8_CALIBRATION_DIR = 'calibration_images'  # ~200 representative kitchen/hand frames
+USE_HALF = torch.cuda.is_available()
+USE_CUDA_GRAPHS = True  # Replay PyTorch models as CUDA graphs when TensorRT is not used
+NMS_IOU = 0.7
+UTENSIL_DETECT_INTERVAL = 3  # Run the utensil detector every N frames, tracked in between
+HAND_DETECT_INTERVAL = 2  # Run the pose model every N frames, tracked in between
+TRACK_IOU_THRESHOLD = 0.3
+MAX_BATCH_SIZE = 4  # Frames already waiting to be processed are inferred together
+TENSORRT_OPT_BATCH = 1  # The default client waits for each result, so most batches are one frame
+PIPELINE_QUEUE_SIZE = 2  # Results waiting to be sent
+H264_READ_TIMEOUT_MS = 500  # cap.read() gives up after this, so the receive thread can stop
+
+def configure_torch():
     """
-    Process a frame and return detection results
+    Let cuDNN autotune convolutions and allow TF32 Tensor Core math on CUDA
     """
-    # Run YOLOv8 object detection for utensils
-    results = model(frame, conf=0.5, verbose=False)
-    
-    # Run YOLOv8 pose estimation for hand detection
-    pose_results = pose_model(frame, conf=0.5, verbose=False)
+    if not torch.cuda.is_available():
+        return
+    torch.set_float32_matmul_precision('high')
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cudnn.benchmark = True
+
+def prepare_pytorch_model(yolo_model):
+    """
+    Fuse Conv+BN, and switch the weights to channels_last on CUDA.
+    Fusing first matters: Ultralytics fuses again when it builds the predictor,
+    which would replace the converted conv weights.
+    """
+    yolo_model.fuse()
+    if torch.cuda.is_available():
+        yolo_model.model.to(memory_format=torch.channels_last)
+    return yolo_model
+
+class StaticInputModel:
+    """
+    Runs a YOLOv8 PyTorch model without the Ultralytics predictor.
+    Frames are letterboxed into a persistent host buffer and copied into a
+    persistent input tensor on the model's device, then model.model is
+    called directly and NMS is done with ultralytics.utils.ops. This skips
+    the predictor's per-call Python preprocessing and tensor allocations.
+    Called like a YOLO model and returns Ultralytics Results, so the rest
+    of the server does not care.
+    The buffers are sized from the first frame (longest side INFERENCE_SIZE,
+    padded to the model stride) and only reallocated if the frame size
+    changes. Batches are run one frame at a time.
+    """
+    def __init__(self, yolo_model, device, imgsz=INFERENCE_SIZE):
+        self.names = yolo_model.names
+        self.imgsz = imgsz
+        self.device = torch.device(device)
+        self.dtype = torch.float16 if USE_HALF and self.device.type == 'cuda' else torch.float32
+        self.net = yolo_model.model.to(self.device, dtype=self.dtype).eval()
+        self.kpt_shape = getattr(self.net, 'kpt_shape', None)
+        self.stride = int(self.net.stride.max())
+        self.static_in = None
+        self.host_in = None
+
+    def _input_shape(self, frame):
+        h, w = frame.shape[:2]
+        r = min(self.imgsz / h, self.imgsz / w)
+        return (math.ceil(round(h * r) / self.stride) * self.stride,
+                math.ceil(round(w * r) / self.stride) * self.stride)
+
+    def _allocate(self, shape):
+        self.static_in = torch.zeros(1, 3, *shape, device=self.device, dtype=self.dtype)
+        if self.device.type == 'cuda':
+            self.static_in = self.static_in.contiguous(memory_format=torch.channels_last)
+        self.host_in = torch.empty((*shape, 3), dtype=torch.uint8,
+                                   pin_memory=self.device.type == 'cuda')
+
+    def __call__(self, source, conf=0.5, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        results = []
+        with torch.inference_mode():
+            for frame in frames:
+                shape = self._input_shape(frame)
+                if self.static_in is None or tuple(self.static_in.shape[2:]) != shape:
+                    self._allocate(shape)
+                letterbox(frame, shape, out=self.host_in.numpy())
+                self._fill(self.host_in.to(self.device, non_blocking=True))
+                out = self.net(self.static_in)
+                preds = out[0] if isinstance(out, (list, tuple)) else out
+                results.append(self._postprocess(preds, frame, conf))
+        return results
+
+    def _fill(self, img):
+        # BGR HWC uint8 -> RGB NCHW in [0, 1], written into the persistent input
+        self.static_in.copy_(img.permute(2, 0, 1).flip(0).unsqueeze(0))
+        self.static_in.div_(255)
+
+    def _postprocess(self, preds, frame, conf):
+        pred = ops.non_max_suppression(preds, conf, NMS_IOU, nc=len(self.names))[0]
+        pred[:, :4] = ops.scale_boxes(self.static_in.shape[2:], pred[:, :4], frame.shape).round()
+        keypoints = None
+        if self.kpt_shape is not None:
+            keypoints = pred[:, 6:].view(len(pred), *self.kpt_shape)
+            keypoints = ops.scale_coords(self.static_in.shape[2:], keypoints, frame.shape)
+        return Results(frame, path='', names=self.names, boxes=pred[:, :6], keypoints=keypoints)
+
+class CUDAGraphModel(StaticInputModel):
+    """
+    StaticInputModel whose forward pass is captured as a CUDA graph and
+    replayed with graph.replay(), which removes the per-layer kernel
+    launch overhead.
     
-    # Get results
-    result = results[0]
-    pose_result = pose_results[0]
+    Frames are staged through two pinned host buffers and uploaded with
+    non_blocking copies on a separate copy stream, while the graph runs on
+    its own compute stream. The next frame of a batch is letterboxed and
+    uploaded while the current one is still being inferred.
     
-    # Extract utensil detections
-    utensil_detections = []
-    for box in result.boxes:
-        class_id = int(box.cls[0])
-        class_name = result.names[class_id]
-        confidence = float(box.conf[0])
+    A graph needs one fixed input shape, so this always uses a square
+    INFERENCE_SIZE x INFERENCE_SIZE input.
+    """
+    def __init__(self, yolo_model, imgsz=INFERENCE_SIZE):
+        super().__init__(yolo_model, 'cuda', imgsz)
+        self._allocate((imgsz, imgsz))
         
-        if class_name in UTENSIL_CLASSES:
-            x1, y1, x2, y2 = box.xyxy[0]
-            utensil_detections.append({
-                'class_name': class_name,
-                'confidence': confidence,
-                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-            })
-    
-    # Extract hand/person detections
-    hand_detections = []
-    keypoints_data = []
-    
-    for box in pose_result.boxes:
-        class_id = int(box.cls[0])
-        class_name = pose_result.names[class_id]
-        confidence = float(box.conf[0])
+        # Double-buffered BGR uint8 staging: pinned host -> device
+        self.pinned = [self.host_in, torch.empty_like(self.host_in).pin_memory()]
+        self.staged = [torch.empty((imgsz, imgsz, 3), dtype=torch.uint8, device=self.device) for _ in range(2)]
+        self.copy_done = [torch.cuda.Event() for _ in range(2)]
+        self.copy_stream = torch.cuda.Stream()
+        self.stream = torch.cuda.Stream()
         
-        if class_name == 'person':
-            x1, y1, x2, y2 = box.xyxy[0]
-            hand_detections.append({
-                'class_name': 'person',
-                'confidence': confidence,
-                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-            })
+        with torch.inference_mode():
+            # Warm up on a side stream (cuDNN autotune, anchors) before capturing
+            self.stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(self.stream):
+                for _ in range(3):
+                    self.net(self.static_in)
+            torch.cuda.current_stream().wait_stream(self.stream)
+            
+            self.graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self.graph):
+                out = self.net(self.static_in)
+            self.static_out = out[0] if isinstance(out, (list, tuple)) else out
+
+    def __call__(self, source, conf=0.5, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        results = []
+        with torch.inference_mode():
+            if frames:
+                self._stage(frames[0], 0)
+            for i, frame in enumerate(frames):
+                self._launch(i % 2)
+                # Prefetch the next frame while the GPU runs this one
+                if i + 1 < len(frames):
+                    self._stage(frames[i + 1], (i + 1) % 2)
+                with torch.cuda.stream(self.stream):
+                    result = self._postprocess(self.static_out, frame, conf)
+                # Results are read on the default stream, and static_out is reused by the next replay
+                self.stream.synchronize()
+                results.append(result)
+        return results
+
+    def _stage(self, frame, slot):
+        # The previous copy out of this slot finished before its frame was postprocessed
+        letterbox(frame, (self.imgsz, self.imgsz), out=self.pinned[slot].numpy())
+        with torch.cuda.stream(self.copy_stream):
+            self.staged[slot].copy_(self.pinned[slot], non_blocking=True)
+            self.copy_done[slot].record(self.copy_stream)
+
+    def _launch(self, slot):
+        with torch.cuda.stream(self.stream):
+            self.stream.wait_event(self.copy_done[slot])
+            self._fill(self.staged[slot])
+            self.graph.replay()
+
+def prepare_direct_model(yolo_model):
+    """
+    Wrap a PyTorch model so it runs from a persistent input tensor, as a
+    CUDA graph on CUDA machines. Falls back to the plain YOLO model.
+    """
+    if torch.cuda.is_available() and USE_CUDA_GRAPHS:
+        try:
+            return CUDAGraphModel(yolo_model)
+        except Exception as e:
+            print(f"⚠️  CUDA graph capture failed ({e}), running without graphs")
+    try:
+        return StaticInputModel(yolo_model, 'cuda' if torch.cuda.is_available() else 'cpu')
+    except Exception as e:
+        print(f"⚠️  Could not set up direct inference ({e}), using the YOLO predictor")
+        return yolo_model
+
+def load_model(weights):
+    """
+    Load a YOLOv8 model, preferring a TensorRT engine on CUDA machines.
+    The engine is built once next to the .pt file and reused on later runs,
+    its name records the precision and the max and tuned batch sizes.
+    Falls back to the PyTorch weights if the export fails, which are run
+    from a persistent input tensor (as a CUDA graph where possible).
+    """
+    pt_model = YOLO(weights)
+    if not (USE_TENSORRT and torch.cuda.is_available()):
+        return prepare_direct_model(prepare_pytorch_model(pt_model))
     
-    # Extract keypoints if available
-    if hasattr(pose_result, 'keypoints') and pose_result.keypoints is not None:
-        for keypoints in pose_result.keypoints:
-            if keypoints.xy is not None:
-                kpts = keypoints.xy[0].cpu().numpy()
-                if len(kpts) > 10:
-                    # Left wrist (index 9) and right wrist (index 10)
-                    keypoints_data.append({
-                        'left_wrist': [int(kpts[9][0]), int(kpts[9][1])] if kpts[9][0] > 0 else None,
-                        'right_wrist': [int(kpts[10][0]), int(kpts[10][1])] if kpts[10][0] > 0 else None
-                    })
+    int8_images = calibration_images(INT8_CALIBRATION_DIR) if TENSORRT_INT8 else []
+    if TENSORRT_INT8 and len(int8_images) < MAX_BATCH_SIZE:
+        print(f"⚠️  Not enough images in {INT8_CALIBRATION_DIR}/ for INT8 calibration, using FP16")
+        int8_images = []
+    precision = 'int8' if int8_images else 'fp16'
+    engine_path = f"{os.path.splitext(weights)[0]}_{precision}_b{MAX_BATCH_SIZE}o{TENSORRT_OPT_BATCH}.engine"
+    if not os.path.exists(engine_path):
+        print(f"   Building {precision.upper()} TensorRT engine for {weights} "
+              f"(one time, this can take a few minutes)...")
+        try:
+            build_tensorrt_engine(pt_model, engine_path, INFERENCE_SIZE, MAX_BATCH_SIZE,
+                                  opt_batch=TENSORRT_OPT_BATCH, int8_images=int8_images)
+        except Exception as e:
+            print(f"⚠️  TensorRT export failed ({e}), using PyTorch model")
+            return prepare_direct_model(prepare_pytorch_model(pt_model))
+    
+    try:
+        return YOLO(engine_path, task=pt_model.task)
+    except Exception as e:
+        print(f"⚠️  Could not load TensorRT engine ({e}), using PyTorch model")
+        return prepare_direct_model(prepare_pytorch_model(pt_model))
+
+_utensil_id_tensors = {}
+
+def _utensil_ids_on(device):
+    """
+    Utensil class IDs as a tensor on the given device, cached per device
+    """
+    if device not in _utensil_id_tensors:
+        _utensil_id_tensors[device] = torch.tensor(sorted(UTENSIL_IDS), device=device)
+    return _utensil_id_tensors[device]
+
+def extract_utensils(result):
+    """
+    Extract utensil detections from a detector result as arrays
+    Filtering happens on the model's device, followed by a single
+    device to host copy for all kept boxes.
+    """
+    boxes = result.boxes.data  # x1, y1, x2, y2, conf, cls per row
+    cls = boxes[:, -1].to(torch.int64)
+    kept = boxes[torch.isin(cls, _utensil_ids_on(cls.device))].cpu().numpy()
     
     return {
-        'utensils': utensil_detections,
-        'hands': hand_detections,
-        'keypoints': keypoints_data
+        'cls': kept[:, -1].astype(np.int8),
+        'conf': kept[:, -2].astype(np.float16),
+        'xyxy': kept[:, :4].astype(np.int16)
+    }
+
+def extract_hands(pose_result):
+    """
+    Extract hand/person detections and wrist keypoints from a pose result
+    """
+    boxes = pose_result.boxes.data.cpu().numpy()
+    person_ids = [i for i, name in pose_result.names.items() if name == 'person']
+    people = boxes[np.isin(boxes[:, -1].astype(np.int32), person_ids)]
+    hand_detections = {
+        'conf': people[:, -2].astype(np.float16),
+        'xyxy': people[:, :4].astype(np.int16)
     }
+    
+    # Extract keypoints if available
+    wrists = np.zeros((0, 2, 2), dtype=np.int16)
+    keypoints = getattr(pose_result, 'keypoints', None)
+    if keypoints is not None and keypoints.xy is not None:
+        kpts = keypoints.xy.cpu().numpy()  # (people, keypoints, 2)
+        if kpts.ndim == 3 and kpts.shape[1] > 10:
+            # Left wrist (index 9) and right wrist (index 10), (0, 0) when not visible
+            wrists = kpts[:, 9:11].astype(np.int16)
+    
+    return hand_detections, wrists
+
+def box_iou(a, b):
+    """
+    IoU matrix between two sets of xyxy boxes
+    """
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+class BoxTracker:
+    """
+    Minimal IoU tracker with constant velocity, used to move boxes along on
+    frames where the model is skipped. Boxes keep the order of the last
+    detection, so the other per-box arrays (class, confidence) still line up.
+    """
+    def __init__(self, iou_threshold=TRACK_IOU_THRESHOLD):
+        self.iou_threshold = iou_threshold
+        self.detected = np.zeros((0, 4), dtype=np.float32)
+        self.boxes = self.detected
+        self.velocity = self.detected
+        self.frames_since_update = 0
+
+    def update(self, xyxy):
+        """
+        Take fresh detections, matching them greedily by IoU to the last
+        ones to estimate each box's per-frame velocity
+        """
+        new = np.asarray(xyxy, dtype=np.float32)
+        elapsed = self.frames_since_update + 1
+        velocity = np.zeros_like(new)
+        if len(new) and len(self.detected):
+            ious = box_iou(new, self.detected)
+            matched_new, matched_old = set(), set()
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                n, o = np.unravel_index(flat, ious.shape)
+                if ious[n, o] < self.iou_threshold:
+                    break
+                if n in matched_new or o in matched_old:
+                    continue
+                matched_new.add(n)
+                matched_old.add(o)
+                velocity[n] = (new[n] - self.detected[o]) / elapsed
+        self.detected = new
+        self.boxes = new.copy()
+        self.velocity = velocity
+        self.frames_since_update = 0
+
+    def predict(self):
+        """
+        Advance every box by one frame of motion
+        """
+        self.boxes = self.boxes + self.velocity
+        self.frames_since_update += 1
+        return self.boxes
+
+def _detection_indices(frame_index, count, interval, tracking):
+    """
+    Frames of a batch that get a fresh detection (always the first one before any tracking)
+    """
+    indices = [i for i in range(count) if (frame_index + i) % interval == 0]
+    if not indices and not tracking:
+        indices = [0]
+    return indices
+
+def process_frames(frames, model, pose_model, state=None):
+    """
+    Process a batch of frames with one inference call per model and
+    return a list of detection results in the same order as frames.
+    The utensil detector runs every UTENSIL_DETECT_INTERVAL frames and the
+    pose model every HAND_DETECT_INTERVAL frames. In between, the last
+    detections are moved along by a BoxTracker kept in state.
+    """
+    if state is None:
+        state = {}
+    frame_index = state.get('frame_index', 0)
+    state['frame_index'] = frame_index + len(frames)
+    
+    utensil_indices = _detection_indices(frame_index, len(frames), UTENSIL_DETECT_INTERVAL,
+                                         'utensil_tracker' in state)
+    hand_indices = _detection_indices(frame_index, len(frames), HAND_DETECT_INTERVAL,
+                                      'hand_tracker' in state)
+    
+    with torch.inference_mode():
+        # Run YOLOv8 pose estimation for hand detection
+        pose_results = []
+        if hand_indices:
+            pose_results = pose_model([frames[i] for i in hand_indices], conf=0.5,
+                                      imgsz=INFERENCE_SIZE, half=USE_HALF, verbose=False)
+        
+        # Run YOLOv8 object detection for utensils
+        results = []
+        if utensil_indices:
+            results = model([frames[i] for i in utensil_indices], conf=0.5,
+                            imgsz=INFERENCE_SIZE, half=USE_HALF, verbose=False)
+    detector_results = dict(zip(utensil_indices, results))
+    pose_by_frame = dict(zip(hand_indices, pose_results))
+    
+    utensil_tracker = state.setdefault('utensil_tracker', BoxTracker())
+    hand_tracker = state.setdefault('hand_tracker', BoxTracker())
+    
+    batch_results = []
+    for i in range(len(frames)):
+        if i in detector_results:
+            state['utensils'] = extract_utensils(detector_results[i])
+            utensil_tracker.update(state['utensils']['xyxy'])
+            utensils = state['utensils']
+        else:
+            utensils = dict(state['utensils'], xyxy=utensil_tracker.predict().round().astype(np.int16))
+        
+        if i in pose_by_frame:
+            state['hands'], state['keypoints'] = extract_hands(pose_by_frame[i])
+            hand_tracker.update(state['hands']['xyxy'])
+            hands, keypoints = state['hands'], state['keypoints']
+        else:
+            predicted = hand_tracker.predict()
+            hands = dict(state['hands'], xyxy=predicted.round().astype(np.int16))
+            keypoints = state['keypoints']
+            if len(keypoints) == len(predicted):
+                # Move visible wrists with their person's box centre
+                shift = (predicted - hand_tracker.detected).reshape(-1, 2, 2).mean(axis=1)
+                visible = keypoints[..., :1] > 0
+                keypoints = np.where(visible, keypoints + shift[:, None, :].round(), keypoints).astype(np.int16)
+        
+        batch_results.append({
+            'utensils': utensils,
+            'hands': hands,
+            'keypoints': keypoints
+        })
+    
+    return batch_results
+
+def socket_frames(reader):
+    """
+    Yield JPEG frames received on the client socket
+    """
+    while True:
+        frame_data = reader.read()
+        if frame_data is None:
+            return
+        yield decode_frame(frame_data)
+
+def video_frames(cap, stop_event):
+    """
+    Yield frames decoded from the client's H.264 stream until stop_event is set.
+    cap is opened with a read timeout so cap.read() returns on its own, and it
+    is released here, on the thread that reads it, once the frames stop.
+    """
+    try:
+        while not stop_event.is_set():
+            read_start = time.monotonic()
+            ret, frame = cap.read()
+            if ret:
+                yield frame
+            elif time.monotonic() - read_start < H264_READ_TIMEOUT_MS / 2000:
+                return  # Failed straight away instead of timing out, the stream is gone
+    finally:
+        cap.release()
+
+def _put_until_stopped(q, item, stop_event):
+    """
+    Put an item on a bounded queue without blocking forever once stopped
+    """
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get_until_stopped(q, stop_event):
+    """
+    Get an item from a queue, returns None once stopped
+    """
+    while not stop_event.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return None
+
+def run_pipeline(frames, client_socket, model, pose_model, stop_event=None, watch_socket=False):
+    """
+    Run receive, inference and send as three stages connected by bounded
+    queues, so receiving frame N+1 and sending result N-1 overlap with
+    inference on frame N. Inference stays on the calling thread.
+    frames is a generator, closed on the receive thread when it is done.
+    stop_event, if given, is the one frames watches to stop on its own.
+    With watch_socket (H.264 mode, frames do not come over the socket) the
+    client socket is read only to notice the client disconnecting.
+    Returns once the receive thread has finished.
+    """
+    recv_q = queue.Queue(maxsize=MAX_BATCH_SIZE)
+    send_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    if stop_event is None:
+        stop_event = threading.Event()
+    
+    def recv_loop():
+        try:
+            for frame in frames:
+                if not _put_until_stopped(recv_q, frame, stop_event):
+                    return
+        except Exception as e:
+            if not stop_event.is_set():
+                print(f"\n⚠️  Receive error: {e}")
+        finally:
+            frames.close()
+        _put_until_stopped(recv_q, None, stop_event)
+    
+    def send_loop():
+        while True:
+            results = send_q.get()
+            if results is None:
+                return
+            if stop_event.is_set():
+                continue  # Keep draining so the inference stage never blocks
+            try:
+                send_message(client_socket, encode_results(results))
+            except Exception as e:
+                print(f"\n⚠️  Send error: {e}")
+                stop_event.set()
+    
+    def watch_loop():
+        # The client sends nothing here, so EOF or an error means it is gone
+        try:
+            while client_socket.recv(RECV_CHUNK_SIZE):
+                pass
+        except OSError:
+            pass
+        if not stop_event.is_set():
+            print("\n⚠️  Client disconnected")
+            stop_event.set()
+    
+    recv_thread = threading.Thread(target=recv_loop, daemon=True)
+    send_thread = threading.Thread(target=send_loop, daemon=True)
+    recv_thread.start()
+    send_thread.start()
+    if watch_socket:
+        threading.Thread(target=watch_loop, daemon=True).start()
+    
+    frame_count = 0
+    start_time = time.time()
+    detection_state = {}
+    
+    receiving = True
+    
+    try:
+        while receiving:
+            frame = _get_until_stopped(recv_q, stop_event)
+            if frame is None:
+                break
+            
+            # Batch up any further frames that are already waiting
+            frames_batch = [frame]
+            while len(frames_batch) < MAX_BATCH_SIZE:
+                try:
+                    frame = recv_q.get_nowait()
+                except queue.Empty:
+                    break
+                if frame is None:
+                    receiving = False
+                    break
+                frames_batch.append(frame)
+            
+            # Process frames
+            detection_start = time.time()
+            batch_results = process_frames(frames_batch, model, pose_model, detection_state)
+            detection_time = (time.time() - detection_start) / len(frames_batch)
+            
+            # Send results back in the order the frames arrived
+            for results in batch_results:
+                send_q.put(results)
+                
+                frame_count += 1
+                
+                # Print stats every 30 frames
+                if frame_count % 30 == 0:
+                    elapsed = time.time() - start_time
+                    fps = frame_count / elapsed
+                    print(f"📊 Processed {frame_count} frames | "
+                          f"FPS: {fps:.1f} | "
+                          f"Detection time: {detection_time*1000:.1f}ms | "
+                          f"Batch: {len(frames_batch)} | "
+                          f"Utensils: {len(results['utensils']['cls'])} | "
+                          f"Hands: {len(results['hands']['conf'])}")
+    finally:
+        # Let the sender flush what is queued, then stop the receiver.
+        # Shutting the socket down unblocks a recv() in the receive or watch thread.
+        send_q.put(None)
+        send_thread.join()
+        stop_event.set()
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        recv_thread.join()
 
 def main():
+    parser = argparse.ArgumentParser(description='Utensil Detection Server')
+    parser.add_argument('--port', type=int, default=8888, help='Server port (default: 8888)')
+    parser.add_argument('--unix', type=str, default=None, metavar='PATH',
+                        help='Listen on a Unix domain socket instead of TCP (client on the same machine)')
+    parser.add_argument('--h264', action='store_true',
+                        help='Receive H.264 video over UDP instead of JPEG frames (needs GStreamer)')
+    parser.add_argument('--video-port', type=int, default=H264_VIDEO_PORT,
+                        help=f'UDP port for the H.264 stream (default: {H264_VIDEO_PORT})')
+    args = parser.parse_args()
+    
     # Server configuration
     HOST = '0.0.0.0'  # Listen on all interfaces
-    PORT = 8888
+    PORT = args.port
     
     print("=" * 60)
     print("UTENSIL DETECTION SERVER - Running on Mac/PC")
     print("=" * 60)
     
+    configure_torch()
+    
     # Load models
     print("\n[1/3] Loading YOLOv8 object detection model...")
-    model = YOLO('yolov8n.pt')
+    model = load_model('yolov8n.pt')
     print("✓ Object detection model loaded")
     
     print("[2/3] Loading YOLOv8 pose estimation model...")
-    pose_model = YOLO('yolov8n-pose.pt')
+    pose_model = load_model('yolov8n-pose.pt')
     print("✓ Pose estimation model loaded")
     
     # Create socket
-    print(f"[3/3] Starting server on {HOST}:{PORT}...")
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server_socket.bind((HOST, PORT))
-    server_socket.listen(5)
-    print(f"✓ Server listening on port {PORT}")
-    
-    # Get local IP address for display
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(('8.8.8.8', 80))
-        local_ip = s.getsockname()[0]
-    except:
-        local_ip = '127.0.0.1'
-    finally:
-        s.close()
+    if args.unix:
+        # Same machine: skip the TCP/IP stack entirely
+        print(f"[3/3] Starting server on {args.unix}...")
+        if os.path.exists(args.unix):
+            # Only clear a stale socket from an earlier run, never some other file
+            if not stat.S_ISSOCK(os.stat(args.unix).st_mode):
+                print(f"❌ {args.unix} exists and is not a socket, refusing to replace it")
+                return
+            os.unlink(args.unix)
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server_socket.bind(args.unix)
+        server_socket.listen(5)
+        print(f"✓ Server listening on {args.unix}")
+    else:
+        print(f"[3/3] Starting server on {HOST}:{PORT}...")
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((HOST, PORT))
+        server_socket.listen(5)
+        print(f"✓ Server listening on port {PORT}")
     
     print("\n" + "=" * 60)
     print("SERVER READY!")
     print("=" * 60)
-    print(f"\n📡 Waiting for Raspberry Pi to connect...")
-    print(f"\n💡 On your Raspberry Pi, use this IP address: {local_ip}")
-    print(f"   Run: python3 pi_client.py --server {local_ip}\n")
-    
-    while True:
+    if args.unix:
+        print(f"\n📡 Waiting for a local client to connect...")
+        print(f"   Run: python3 pi_client.py --unix {args.unix}{' --h264' if args.h264 else ''}\n")
+    else:
+        # Get local IP address for display
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            # Accept connection
-            client_socket, addr = server_socket.accept()
-            print(f"\n✓ Connected to Raspberry Pi at {addr[0]}:{addr[1]}")
-            
-            data = b""
-            payload_size = struct.calcsize("Q")
-            frame_count = 0
-            start_time = time.time()
-            
-            while True:
-                # Retrieve message size
-                while len(data) < payload_size:
-                    packet = client_socket.recv(4096)
-                    if not packet:
-                        break
-                    data += packet
-                
-                if len(data) < payload_size:
-                    break
-                
-                packed_msg_size = data[:payload_size]
-                data = data[payload_size:]
-                msg_size = struct.unpack("Q", packed_msg_size)[0]
-                
-                # Retrieve frame data
-                while len(data) < msg_size:
-                    data += client_socket.recv(4096)
-                
-                frame_data = data[:msg_size]
-                data = data[msg_size:]
-                
-                # Deserialize frame
-                frame = pickle.loads(frame_data)
-                
-                # Process frame
-                detection_start = time.time()
-                results = process_frame(frame, model, pose_model)
-                detection_time = time.time() - detection_start
-                
-                # Send results back
-                result_data = pickle.dumps(results)
-                message_size = struct.pack("Q", len(result_data))
-                client_socket.sendall(message_size + result_data)
+            s.connect(('8.8.8.8', 80))
+            local_ip = s.getsockname()[0]
+        except:
+            local_ip = '127.0.0.1'
+        finally:
+            s.close()
+        
+        print(f"\n📡 Waiting for Raspberry Pi to connect...")
+        print(f"\n💡 On your Raspberry Pi, use this IP address: {local_ip}")
+        if args.h264:
+            print(f"   Run: python3 pi_client.py --server {local_ip} --h264\n")
+        else:
+            print(f"   Run: python3 pi_client.py --server {local_ip}\n")
+    
+    try:
+        while True:
+            try:
+                # Accept connection
+                client_socket, addr = server_socket.accept()
+                if args.unix:
+                    print(f"\n✓ Local client connected on {args.unix}")
+                else:
+                    print(f"\n✓ Connected to Raspberry Pi at {addr[0]}:{addr[1]}")
                 
-                frame_count += 1
+                stop_event = threading.Event()
+                if args.h264:
+                    # The read timeout lets the receive thread notice stop_event and release
+                    # the capture itself, VideoCapture must not be released mid-read
+                    video_capture = cv2.VideoCapture(h264_receiver_pipeline(args.video_port), cv2.CAP_GSTREAMER,
+                                                     [cv2.CAP_PROP_READ_TIMEOUT_MSEC, H264_READ_TIMEOUT_MS])
+                    if not video_capture.isOpened():
+                        video_capture.release()
+                        print("❌ Could not open H.264 stream (is OpenCV 4.8+ built with GStreamer?)")
+                        print("Waiting for new connection...")
+                        continue
+                    frames = video_frames(video_capture, stop_event)
+                else:
+                    frames = socket_frames(MessageReader(client_socket))
                 
-                # Print stats every 30 frames
-                if frame_count % 30 == 0:
-                    elapsed = time.time() - start_time
-                    fps = frame_count / elapsed
-                    print(f"📊 Processed {frame_count} frames | "
-                          f"FPS: {fps:.1f} | "
-                          f"Detection time: {detection_time*1000:.1f}ms | "
-                          f"Utensils: {len(results['utensils'])} | "
-                          f"Hands: {len(results['hands'])}")
-        
-        except Exception as e:
-            print(f"\n⚠️  Connection error: {e}")
-            print("Waiting for new connection...")
-            continue
-        finally:
-            if 'client_socket' in locals():
-                client_socket.close()
+                # In H.264 mode the stream itself never ends, so the socket is watched
+                # for the disconnect. run_pipeline returns after the capture is released,
+                # so the next client's udpsrc never shares the port with this one.
+                run_pipeline(frames, client_socket, model, pose_model, stop_event, watch_socket=args.h264)
+            
+            except Exception as e:
+                print(f"\n⚠️  Connection error: {e}")
+                print("Waiting for new connection...")
+                continue
+            finally:
+                if 'client_socket' in locals():
+                    client_socket.close()
+    finally:
+        server_socket.close()
+        if args.unix and os.path.exists(args.unix) and stat.S_ISSOCK(os.stat(args.unix).st_mode):
+            os.unlink(args.unix)
 
 if __name__ == "__main__":
     try:
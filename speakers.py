@@ -21,16 +21,23 @@ import random
 # pygame.mixer.music.stop()
 # pygame.mixer.quit()
 
+PLAY_DURATION = 2.0  # seconds
+
+SOUND_FILES = ("Sampada.mp3", "Intia.mp3", "Ethan.mp3")
+SOUNDS = None  # Decoded on the first play_sound() call, not on import
+
+def load_sounds():
+    # Open the mixer and decode the sounds once instead of on every call.
+    # Without an audio device this raises pygame.error, here rather than on import.
+    global SOUNDS
+    if SOUNDS is None:
+        pygame.mixer.init()
+        SOUNDS = [pygame.mixer.Sound(f) for f in SOUND_FILES]
+    return SOUNDS
+
 def play_sound():
-    pygame.mixer.init()
-    choice = random.randint(1, 3)
-    if choice == 1:
-        pygame.mixer.music.load("Sampada.mp3")
-    elif choice == 2:
-        pygame.mixer.music.load("Intia.mp3")
-    elif choice == 3:
-        pygame.mixer.music.load("Ethan.mp3")
-    pygame.mixer.music.play()
-    time.sleep(2)
-    pygame.mixer.music.stop()
-    pygame.mixer.quit()
+    channel = random.choice(load_sounds()).play(maxtime=int(PLAY_DURATION * 1000))
+    # Still block until the clip is done, like before
+    deadline = time.monotonic() + PLAY_DURATION
+    while channel is not None and channel.get_busy() and time.monotonic() < deadline:
+        time.sleep(0.01)
@@ -4,11 +4,24 @@ import speakers
 #
 
 import cv2
+import numpy as np
 import torch
 from ultralytics import YOLO
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
 import time
-from collections import defaultdict
+import os
+import sys
+import subprocess
+import tempfile
+import asyncio
+import queue
+import threading
+from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
 import pyttsx3
+from drawing import draw_labels
+from inference import letterbox, calibration_images, build_tensorrt_engine
 try:
     from ultralytics.nn.tasks import DetectionModel
     from torch.nn.modules.container import Sequential
@@ -32,6 +45,15 @@ except Exception as e:
     print("Attempting to use older loading method...")
     pass
 
+# OpenVINO is optional, it is only used on machines without a CUDA GPU
+try:
+    from openvino import Core
+except ImportError:
+    try:
+        from openvino.runtime import Core  # openvino 2023.0, before Core moved to the top level
+    except ImportError:
+        Core = None
+
 UTENSIL_CLASSES = {
     'fork': 42,
     'knife': 43,
@@ -44,166 +66,515 @@ UTENSIL_CLASSES = {
 
 HAND_CLASS = 'person'
 
-def main():
+CAPTURE_WIDTH = 1280
+CAPTURE_HEIGHT = 720
+INFERENCE_SIZE = 640
+USE_TENSORRT = True  # Use TensorRT engines when a CUDA GPU is available
+TENSORRT_INT8 = False  # INT8 needs calibration images, FP16 is used otherwise
+INT8_CALIBRATION_DIR = 'calibration_images'  # ~200 representative kitchen/hand frames for TensorRT
+INT8_CALIBRATION_DATA = 'coco128.yaml'  # Dataset yaml for the OpenVINO INT8 export
+USE_OPENVINO = True  # Without CUDA, run OpenVINO exports with two requests in flight
+OPENVINO_INT8 = False  # Quantize the OpenVINO export, FP16 otherwise. Opt-in: the export pip-installs nncf and downloads coco128
+NMS_IOU = 0.7
+USE_HALF = torch.cuda.is_available()  # FP16 PyTorch inference on CUDA, engines are FP16 already
+MAX_BATCH_SIZE = 4  # Frames already waiting are inferred together in one call
+DETECT_INTERVAL = 2  # Run the models every N frames, objects in a sink move slowly
+
+def downscale(frame, size=INFERENCE_SIZE):
+    """
+    Shrink a frame so its longest side is size, keeping the aspect ratio.
+    The model then only pads it, and boxes map back with a single factor.
+    """
+    h, w = frame.shape[:2]
+    r = size / max(h, w)
+    if r >= 1:
+        return frame
+    return cv2.resize(frame, (round(w * r), round(h * r)), interpolation=cv2.INTER_AREA)
+
+class OpenVINOModel:
+    """
+    Runs the OpenVINO export of a YOLOv8 model on the CPU with two infer
+    requests, so the next frame can be started while the previous one is
+    still running. start() preprocesses a frame and starts a request,
+    wait() turns its outputs into an Ultralytics Results object.
+    Only two frames may be in flight at once.
+    Can also be called like a YOLO model, which runs frames one at a time synchronously.
+    """
+    def __init__(self, weights, imgsz=INFERENCE_SIZE):
+        pt_model = YOLO(weights)
+        self.names = pt_model.names
+        self.kpt_shape = getattr(pt_model.model, 'kpt_shape', None)
+        self.imgsz = imgsz
+        
+        stem = os.path.splitext(weights)[0]
+        # A failed INT8 export leaves a marker so later launches skip straight to FP16,
+        # delete it to try quantizing again
+        use_int8 = OPENVINO_INT8 and not os.path.exists(stem + '_int8_openvino_failed')
+        model_dir = stem + ('_int8_openvino_model' if use_int8 else '_openvino_model')
+        if not os.path.exists(model_dir):
+            model_dir = self._export(pt_model, weights, imgsz, use_int8)
+        xml_path = os.path.join(model_dir, os.path.splitext(os.path.basename(weights))[0] + '.xml')
+        compiled_model = Core().compile_model(xml_path, 'CPU')
+        self.requests = [compiled_model.create_infer_request() for _ in range(2)]
+        self.next_request = 0
+
+    @staticmethod
+    def _export(pt_model, weights, imgsz, int8):
+        stem = os.path.splitext(weights)[0]
+        if int8:
+            print(f"Exporting {weights} to INT8 OpenVINO (one time, calibrating on {INT8_CALIBRATION_DATA})...")
+            try:
+                return pt_model.export(format='openvino', int8=True, data=INT8_CALIBRATION_DATA, imgsz=imgsz)
+            except Exception as e:
+                print(f"Warning: INT8 export failed ({e}), using FP16")
+                with open(stem + '_int8_openvino_failed', 'w') as f:
+                    f.write(f"{e}\n")
+        fp16_dir = stem + '_openvino_model'
+        if os.path.exists(fp16_dir):
+            return fp16_dir
+        print(f"Exporting {weights} to OpenVINO (one time)...")
+        return pt_model.export(format='openvino', half=True, imgsz=imgsz)
+
+    def start(self, frame):
+        img = letterbox(frame, (self.imgsz, self.imgsz))
+        # BGR HWC uint8 -> RGB NCHW float in [0, 1]
+        blob = img[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32)
+        blob /= 255
+        request = self.requests[self.next_request]
+        self.next_request ^= 1
+        request.start_async({0: blob})
+        return request, frame
+
+    def wait(self, handle, conf=0.5):
+        request, frame = handle
+        request.wait()
+        preds = torch.from_numpy(request.get_output_tensor(0).data.copy())
+        pred = ops.non_max_suppression(preds, conf, NMS_IOU, nc=len(self.names))[0]
+        input_shape = (self.imgsz, self.imgsz)
+        pred[:, :4] = ops.scale_boxes(input_shape, pred[:, :4], frame.shape).round()
+        keypoints = None
+        if self.kpt_shape is not None:
+            keypoints = pred[:, 6:].view(len(pred), *self.kpt_shape)
+            keypoints = ops.scale_coords(input_shape, keypoints, frame.shape)
+        return Results(frame, path='', names=self.names, boxes=pred[:, :6], keypoints=keypoints)
+
+    def __call__(self, source, conf=0.5, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        return [self.wait(self.start(frame), conf) for frame in frames]
+
+def load_pytorch_model(weights):
+    """
+    Load the .pt weights with Conv+BN layers fused up front
+    """
+    model = YOLO(weights)
+    model.fuse()
+    return model
+
+def load_model(weights):
+    """
+    Load a YOLOv8 model, preferring a TensorRT engine on CUDA machines.
+    The engine is built once next to the .pt file and reused on later runs,
+    its name records the precision and max batch size it was built for.
+    Without CUDA an OpenVINO export is used instead when OpenVINO is installed.
+    """
+    if not torch.cuda.is_available():
+        if USE_OPENVINO and Core is not None:
+            try:
+                return OpenVINOModel(weights)
+            except Exception as e:
+                print(f"Warning: OpenVINO export failed ({e}), using PyTorch model")
+        return load_pytorch_model(weights)
+    if not USE_TENSORRT:
+        return load_pytorch_model(weights)
+    
+    pt_model = YOLO(weights)
+    int8_images = calibration_images(INT8_CALIBRATION_DIR) if TENSORRT_INT8 else []
+    if TENSORRT_INT8 and len(int8_images) < MAX_BATCH_SIZE:
+        print(f"Warning: Not enough images in {INT8_CALIBRATION_DIR}/ for INT8 calibration, using FP16")
+        int8_images = []
+    precision = 'int8' if int8_images else 'fp16'
+    engine_path = f"{os.path.splitext(weights)[0]}_{precision}_b{MAX_BATCH_SIZE}.engine"
+    if not os.path.exists(engine_path):
+        print(f"Building {precision.upper()} TensorRT engine for {weights} (one time, this can take a few minutes)...")
+        try:
+            build_tensorrt_engine(pt_model, engine_path, INFERENCE_SIZE, MAX_BATCH_SIZE,
+                                  int8_images=int8_images)
+        except Exception as e:
+            print(f"Warning: TensorRT export failed ({e}), using PyTorch model")
+            return load_pytorch_model(weights)
+    
+    try:
+        return YOLO(engine_path, task=pt_model.task)
+    except Exception as e:
+        print(f"Warning: Could not load TensorRT engine ({e}), using PyTorch model")
+        return load_pytorch_model(weights)
+
+def run_pose(pose_model, frames, stream=None):
+    """
+    Run the pose model, on its own CUDA stream when given one so its
+    kernels can overlap with the detector's on the default stream
+    """
+    # inference_mode is per thread, so each worker enters it itself
+    with torch.inference_mode():
+        if stream is None:
+            return pose_model(frames, conf=0.5, half=USE_HALF, verbose=False)
+        with torch.cuda.stream(stream):
+            pose_results = pose_model(frames, conf=0.5, half=USE_HALF, verbose=False)
+    stream.synchronize()  # Outputs are ready before anyone reads them
+    return pose_results
+
+UNATTENDED_THRESHOLD = 2.0  # seconds
+ALERT_COOLDOWN = 5.0  # seconds between alerts for same utensil type
+PIPELINE_QUEUE_SIZE = 2  # Results waiting to be drawn, small so the display stays current
+DISPLAY_INTERVAL = 2  # Show every Nth rendered frame, imshow/waitKey stay on the main thread for macOS
+ALERT_TEMPLATE = "Warning! {} left unattended in sink!"
+
+def render_alerts(tts_engine):
+    """
+    Synthesize the alert for every utensil to a sound file once,
+    returns {alert message: path} for the files that were written
+    """
+    paths = {}
+    for name in UTENSIL_CLASSES:
+        path = os.path.join(tempfile.gettempdir(), f"utensil_alert_{name.replace(' ', '_')}.wav")
+        tts_engine.save_to_file(ALERT_TEMPLATE.format(name), path)
+        paths[ALERT_TEMPLATE.format(name)] = path
+    tts_engine.runAndWait()
+    return {message: path for message, path in paths.items()
+            if os.path.exists(path) and os.path.getsize(path) > 0}
+
+def play_alert(path):
+    """
+    Play a pre-rendered alert file with the platform's player
+    Returns False if it could not be played, so the caller can speak it instead.
+    """
+    try:
+        if sys.platform == 'win32':
+            import winsound
+            winsound.PlaySound(path, winsound.SND_FILENAME)
+            return True
+        player = ['afplay', path] if sys.platform == 'darwin' else ['aplay', '-q', path]
+        return subprocess.run(player).returncode == 0
+    except (OSError, RuntimeError) as e:  # Missing player binary, or winsound failing
+        print(f"Warning: Could not play alert sound ({e})")
+        return False
+
+def tts_worker(alert_q):
+    """
+    Speak alerts from the queue so runAndWait never blocks the render loop
+    pyttsx3 engines are not thread safe, so the worker creates its own.
+    Alerts are rendered to sound files up front and played back, so no
+    speech is synthesized while the detector is running. Each alert is
+    preceded by one of the speakers.py sounds.
+    """
     print("Initializing text-to-speech engine...")
-    tts_engine = pyttsx3.init()
-    tts_engine.setProperty('rate', 150)  # Speed of speech
-    tts_engine.setProperty('volume', 0.9)  # Volume (0.0 to 1.0)
+    try:
+        tts_engine = pyttsx3.init()
+        tts_engine.setProperty('rate', 150)  # Speed of speech
+        tts_engine.setProperty('volume', 0.9)  # Volume (0.0 to 1.0)
+    except Exception as e:
+        # Keep draining the queue so the render loop and shutdown never block on it
+        print(f"Warning: Text-to-speech unavailable ({e}), alerts will only be printed")
+        tts_engine = None
     
-    # Load YOLOv8 model (will download automatically on first run)
-    print("Loading YOLOv8 object detection model...")
-    model = YOLO('yolov8n.pt')  # 'n' for nano (fastest), can use 's', 'm', 'l', 'x' for larger models
+    alert_files = {}
+    if tts_engine is not None:
+        try:
+            alert_files = render_alerts(tts_engine)
+        except Exception as e:
+            print(f"Warning: Could not pre-render alerts ({e}), speaking them live")
     
-    # Load YOLOv8 pose model for hand/person detection
-    print("Loading YOLOv8 pose estimation model...")
-    pose_model = YOLO('yolov8n-pose.pt')  # Detects people and their keypoints including hands
+    while True:
+        alert_message = alert_q.get()
+        if alert_message is None:
+            break
+        
+        #THIS IS THE ADDED SOUND FILE
+        # Played once per alert on this thread, it blocks for up to 2 seconds
+        try:
+            speakers.play_sound()
+        except Exception as e:
+            print(f"Warning: Could not play sound ({e})")
+        
+        if tts_engine is None:
+            continue
+        if alert_message in alert_files and play_alert(alert_files[alert_message]):
+            continue
+        try:
+            tts_engine.say(alert_message)
+            tts_engine.runAndWait()
+        except:
+            pass  # Continue even if TTS fails
     
-    # Tracking variables for unattended utensils
-    utensil_first_seen = {}  # Dictionary to track when each utensil was first seen unattended
-    last_alert_time = {}  # Track when we last alerted for each utensil type
-    UNATTENDED_THRESHOLD = 2.0  # seconds
-    ALERT_COOLDOWN = 5.0  # seconds between alerts for same utensil type
+    if tts_engine is not None:
+        try:
+            tts_engine.stop()
+        except:
+            pass
+
+def detect(model, pose_model, frames, pose_executor, pose_stream):
+    """
+    Run the detector and the pose model on a batch of frames with one call
+    each, returns a (frame, result, pose_result) list in frame order
+    """
+    # Both models see the same downscaled copies, the full frames are kept for display
+    small_frames = [downscale(frame) for frame in frames]
     
-    # Open webcam (0 is default camera, change to 1, 2, etc. if you have multiple cameras)
-    print("Opening webcam...")
+    # Start YOLOv8 pose estimation for hand detection
+    pose_future = pose_executor.submit(run_pose, pose_model, small_frames, pose_stream)
     
-    # Try different camera backends for macOS compatibility
-    cap = None
-    for backend in [cv2.CAP_AVFOUNDATION, cv2.CAP_ANY]:
-        cap = cv2.VideoCapture(0, backend)
-        if cap.isOpened():
-            print(f"Camera opened successfully with backend: {backend}")
-            break
-        cap.release()
+    # Run YOLOv8 object detection for utensils while pose runs
+    with torch.inference_mode():
+        results = model(small_frames, conf=0.5, half=USE_HALF, verbose=False)  # conf is confidence threshold
+    pose_results = pose_future.result()
     
-    if cap is None or not cap.isOpened():
-        print("Error: Could not open webcam")
-        print("\nTroubleshooting steps:")
-        print("1. Go to System Settings > Privacy & Security > Camera")
-        print("2. Enable camera access for Terminal/Python")
-        print("3. Close and restart Terminal")
-        print("4. Make sure no other app is using the camera")
-        return
+    return list(zip(frames, results, pose_results))
+
+class FrameGrabber(threading.Thread):
+    """
+    Grabs frames on its own thread so the pipeline never waits on the
+    driver. Only the newest frame is kept, older ones are dropped.
+    """
+    def __init__(self, cap, max_failures=30):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.max_failures = max_failures
+        self.condition = threading.Condition()
+        self.latest = None
+        self.frame_id = 0
+        self.running = True
+        self.failed = False
+
+    def run(self):
+        # Sometimes the first few frames fail on macOS, so retry
+        consecutive_failures = 0
+        while self.running:
+            ret = self.cap.grab()
+            if ret:
+                ret, frame = self.cap.retrieve()
+            if not ret:
+                consecutive_failures += 1
+                if consecutive_failures > self.max_failures:
+                    print("Error: Too many failed frame captures")
+                    with self.condition:
+                        self.failed = True
+                        self.condition.notify()
+                    break
+                continue  # Try next frame
+            
+            consecutive_failures = 0  # Reset on success
+            with self.condition:
+                self.latest = frame
+                self.frame_id += 1
+                self.condition.notify()
+
+    def read(self, last_id=0, timeout=1.0):
+        """
+        Wait for a frame newer than last_id, returns (frame_id, frame)
+        or (last_id, None) on timeout or capture failure
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id != last_id or self.failed, timeout)
+            if self.frame_id == last_id:
+                return last_id, None
+            frame, self.latest = self.latest, None
+            return self.frame_id, frame
+
+    def stop(self):
+        self.running = False
+        self.join(timeout=1.0)
+
+def start_openvino(model, pose_model, frame):
+    """
+    Start both OpenVINO models on a frame without waiting for them
+    """
+    small = downscale(frame)
+    return frame, model.start(small), pose_model.start(small)
+
+def finish_openvino(model, pose_model, pending):
+    """
+    Wait for a frame started with start_openvino, returns (frame, result, pose_result)
+    """
+    frame, handle, pose_handle = pending
+    with torch.inference_mode():
+        return frame, model.wait(handle), pose_model.wait(pose_handle)
+
+async def capture_task(grabber, frame_q, capture_executor):
+    """
+    Pass the newest webcam frames on to frame_q, None marks the end
+    """
+    loop = asyncio.get_running_loop()
+    frame_id = 0
     
-    # Set camera properties (optional) - some may fail on macOS, that's OK
-    try:
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        cap.set(cv2.CAP_PROP_FPS, 30)
-    except:
-        pass  # Continue even if setting properties fails
+    while True:
+        frame_id, frame = await loop.run_in_executor(capture_executor, grabber.read, frame_id)
+        if frame is None:
+            if grabber.failed:
+                break
+            continue  # Timed out, keep waiting
+        await frame_q.put(frame)
     
-    print("Starting detection... Press 'q' to quit")
+    await frame_q.put(None)
+
+async def infer_task(frame_q, result_q, model, pose_model, infer_executor, pose_executor, pose_stream):
+    """
+    Run both models on frames from frame_q and pass lists of
+    (frame, result, pose_result) on to result_q.
+    The models only run on every DETECT_INTERVAL-th frame, the frames in
+    between reuse the last results.
+    Frames that are already waiting are batched, up to MAX_BATCH_SIZE.
+    With OpenVINO models frames go one at a time, but the next frame is
+    started before the previous one is collected, so the CPU is never idle
+    while frames are handed over.
+    """
+    loop = asyncio.get_running_loop()
+    pipelined = isinstance(model, OpenVINOModel) and isinstance(pose_model, OpenVINOModel)
+    frame_index = 0
+    cached = None  # (result, pose_result) of the last frame the models ran on
+    pending = None  # OpenVINO frame still being inferred
+    skipped = []  # OpenVINO frames waiting for pending's results
+    try:
+        while True:
+            frame = await frame_q.get()
+            if not pipelined:
+                if frame is None:
+                    break
+                frames = [frame]
+                ended = False
+                while len(frames) < MAX_BATCH_SIZE and not frame_q.empty():
+                    frame = frame_q.get_nowait()
+                    if frame is None:
+                        ended = True
+                        break
+                    frames.append(frame)
+                
+                run = [i for i in range(len(frames)) if (frame_index + i) % DETECT_INTERVAL == 0]
+                frame_index += len(frames)
+                detected = {}
+                if run:
+                    outputs = await loop.run_in_executor(infer_executor, detect, model, pose_model,
+                                                         [frames[i] for i in run], pose_executor, pose_stream)
+                    detected = dict(zip(run, outputs))
+                batch = []
+                for i, batch_frame in enumerate(frames):
+                    if i in detected:
+                        cached = detected[i][1:]
+                        batch.append(detected[i])
+                    else:
+                        batch.append((batch_frame, *cached))
+                await result_q.put(batch)
+                if ended:
+                    break
+                continue
+            
+            started = None
+            if frame is not None:
+                if frame_index % DETECT_INTERVAL == 0:
+                    started = await loop.run_in_executor(infer_executor, start_openvino, model, pose_model, frame)
+                else:
+                    skipped.append(frame)
+                frame_index += 1
+            if pending is not None and (started is not None or frame is None):
+                done_frame, result, pose_result = await loop.run_in_executor(
+                    infer_executor, finish_openvino, model, pose_model, pending)
+                await result_q.put([(done_frame, result, pose_result)] +
+                                   [(skipped_frame, result, pose_result) for skipped_frame in skipped])
+                pending = None
+                skipped = []
+            if started is not None:
+                pending = started
+            if frame is None:
+                break
+    except Exception as e:
+        print(f"Error: Inference failed: {e}")
     
-    # Sometimes the first few frames fail on macOS, so retry
-    frame_count = 0
-    consecutive_failures = 0
+    await result_q.put(None)
+
+async def render_task(result_q, alert_q):
+    """
+    Draw detections, track unattended utensils and show the frame
+    Every frame of a batch goes through the tracking, only the newest is shown.
+    Returns when the stream ends or 'q' is pressed.
+    """
+    # Tracking variables for unattended utensils
+    utensil_first_seen = {}  # Dictionary to track when each utensil was first seen unattended
+    last_alert_time = {}  # Track when we last alerted for each utensil type
     
+    display_count = 0
+    batch = []
     while True:
-        # Read frame from webcam
-        ret, frame = cap.read()
-        
-        if not ret:
-            consecutive_failures += 1
-            if consecutive_failures > 30:  # 30 consecutive failures
-                print("Error: Too many failed frame captures")
+        if not batch:
+            batch = await result_q.get()
+            if batch is None:
                 break
-            continue  # Try next frame
-        
-        consecutive_failures = 0  # Reset on success
-        frame_count += 1
-        
-        # Run YOLOv8 object detection for utensils
-        results = model(frame, conf=0.5, verbose=False)  # conf is confidence threshold
-        
-        # Run YOLOv8 pose estimation for hand detection
-        pose_results = pose_model(frame, conf=0.5, verbose=False)
-        
-        # Get the first result (we only have one frame)
-        result = results[0]
-        pose_result = pose_results[0]
+        frame, result, pose_result = batch.pop(0)
         
         # Count utensils and hands detected
-        utensil_count = {}
+        utensil_count = Counter()
         hand_count = 0
         
+        # Copy all boxes to the host at once instead of per box and coordinate
+        # Models ran on a downscaled copy, scale boxes back up to the displayed frame
+        scale = frame.shape[1] / result.orig_shape[1]
+        boxes_np = (result.boxes.xyxy.cpu().numpy() * scale).astype(np.int32)
+        cls_np = result.boxes.cls.cpu().numpy().astype(np.int32)
+        conf_np = result.boxes.conf.cpu().numpy()
+        
         # Draw bounding boxes and labels
-        for box in result.boxes:
-            # Get class ID and name
-            class_id = int(box.cls[0])
-            class_name = result.names[class_id]
-            confidence = float(box.conf[0])
+        utensil_labels = []
+        for i in range(len(cls_np)):
+            # Get class name
+            class_name = result.names[cls_np[i]]
             
             # Check if it's a utensil
             if class_name in UTENSIL_CLASSES:
                 # Get bounding box coordinates
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+                x1, y1, x2, y2 = boxes_np[i].tolist()
                 
                 # Count this utensil
-                utensil_count[class_name] = utensil_count.get(class_name, 0) + 1
+                utensil_count[class_name] += 1
                 
                 # Draw rectangle
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
                 
-                # Draw label with confidence
-                label = f"{class_name}: {confidence:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                
-                # Background for text
-                cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (0, 255, 0), -1)
-                
-                # Put text
-                cv2.putText(frame, label, (x1, y1 - 5), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-
-
-                #THIS IS THE ADDED SOUND FILE
-
-                speakers.play_sound()
+                # Label with confidence, drawn with the others below
+                utensil_labels.append((x1, y1, f"{class_name}: {conf_np[i]:.2f}"))
+        
+        draw_labels(frame, utensil_labels, (0, 255, 0), (0, 0, 0))
         
         # Draw hand/person detections from pose model
-        for box in pose_result.boxes:
-            class_id = int(box.cls[0])
-            class_name = pose_result.names[class_id]
-            confidence = float(box.conf[0])
+        pose_boxes_np = (pose_result.boxes.xyxy.cpu().numpy() * scale).astype(np.int32)
+        pose_cls_np = pose_result.boxes.cls.cpu().numpy().astype(np.int32)
+        pose_conf_np = pose_result.boxes.conf.cpu().numpy()
+        hand_labels = []
+        for i in range(len(pose_cls_np)):
+            class_name = pose_result.names[pose_cls_np[i]]
+            confidence = pose_conf_np[i]
             
             if class_name == 'person':  # Detect people (hands/arms)
                 hand_count += 1
                 
                 # Get bounding box coordinates
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+                x1, y1, x2, y2 = pose_boxes_np[i].tolist()
                 
                 # Draw rectangle in blue for hands/people
                 cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)
                 
-                # Draw label
-                label = f"Hand/Person: {confidence:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                
-                # Background for text
-                cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (255, 0, 0), -1)
-                
-                # Put text
-                cv2.putText(frame, label, (x1, y1 - 5), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+                # Label, drawn with the others below
+                hand_labels.append((x1, y1, f"Hand/Person: {confidence:.2f}"))
+        
+        draw_labels(frame, hand_labels, (255, 0, 0), (255, 255, 255))
         
         # Optionally draw hand keypoints if available
         if hasattr(pose_result, 'keypoints') and pose_result.keypoints is not None:
-            for keypoints in pose_result.keypoints:
-                if keypoints.xy is not None:
-                    # Draw wrist, left hand, right hand keypoints (indices 9, 10 in COCO pose)
-                    kpts = keypoints.xy[0].cpu().numpy()
-                    if len(kpts) > 10:
-                        # Left wrist
-                        if kpts[9][0] > 0 and kpts[9][1] > 0:
-                            cv2.circle(frame, (int(kpts[9][0]), int(kpts[9][1])), 5, (0, 255, 255), -1)
-                        # Right wrist
-                        if kpts[10][0] > 0 and kpts[10][1] > 0:
-                            cv2.circle(frame, (int(kpts[10][0]), int(kpts[10][1])), 5, (0, 255, 255), -1)
+            # All people's keypoints in one copy, shape (people, keypoints, 2)
+            all_kpts = pose_result.keypoints.xy.cpu().numpy()
+            if all_kpts.ndim == 3 and all_kpts.shape[1] > 10:
+                # Left and right wrist (indices 9, 10 in COCO pose)
+                wrists = all_kpts[:, 9:11, :]
+                visible = (wrists[..., 0] > 0) & (wrists[..., 1] > 0)
+                for x, y in (wrists[visible] * scale).astype(np.int32).tolist():
+                    cv2.circle(frame, (x, y), 5, (0, 255, 255), -1)
         
         # Display count summary
         y_offset = 30
@@ -263,15 +634,14 @@ def main():
                             current_time - last_alert_time[utensil_type] >= ALERT_COOLDOWN):
                             
                             # TRIGGER VOICE ALERT
-                            alert_message = f"Warning! {utensil_type} left unattended in sink!"
+                            alert_message = ALERT_TEMPLATE.format(utensil_type)
                             print(f"🔊 ALERT: {alert_message}")
                             
-                            # Play voice alert (non-blocking)
+                            # Hand the alert to the TTS thread, dropping it if one is already waiting
                             try:
-                                tts_engine.say(alert_message)
-                                tts_engine.runAndWait()
-                            except:
-                                pass  # Continue even if TTS fails
+                                alert_q.put_nowait(alert_message)
+                            except queue.Full:
+                                pass
                             
                             last_alert_time[utensil_type] = current_time
                         
@@ -282,13 +652,11 @@ def main():
                         y_offset += 30
             else:
                 # Utensil is attended or no longer present, reset timer
-                if utensil_type in utensil_first_seen:
-                    del utensil_first_seen[utensil_type]
+                utensil_first_seen.pop(utensil_type, None)
         
         # Remove utensils that are no longer detected
-        utensils_to_remove = [u for u in utensil_first_seen.keys() if u not in utensil_count]
-        for utensil_type in utensils_to_remove:
-            del utensil_first_seen[utensil_type]
+        for utensil_type in set(utensil_first_seen).difference(utensil_count):
+            utensil_first_seen.pop(utensil_type, None)
         
         # Display attendance status
         y_offset += 10
@@ -296,18 +664,127 @@ def main():
         cv2.putText(frame, status_text, (10, y_offset), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, state_color, 2)
         
+        if batch:
+            continue  # Not the newest frame of its batch
+        
+        # Pumping the window's event loop costs a few ms, so only do it every DISPLAY_INTERVAL frames
+        display_count += 1
+        if display_count % DISPLAY_INTERVAL:
+            continue
+        
         # Show frame
         cv2.imshow('Utensil & Hand Detection - Press Q to quit', frame)
         
         # Check for 'q' key press
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
+
+async def run_pipeline(grabber, model, pose_model, alert_q, executors, pose_stream):
+    """
+    Capture, inference and render run as tasks joined by bounded queues,
+    so capturing the next frame overlaps with inference on the current one
+    """
+    capture_executor, infer_executor, pose_executor = executors
+    frame_q = asyncio.Queue(maxsize=MAX_BATCH_SIZE)
+    result_q = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
     
-    # Clean up
+    tasks = [
+        asyncio.create_task(capture_task(grabber, frame_q, capture_executor)),
+        asyncio.create_task(infer_task(frame_q, result_q, model, pose_model,
+                                       infer_executor, pose_executor, pose_stream)),
+    ]
+    try:
+        await render_task(result_q, alert_q)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    alert_q = queue.Queue(maxsize=1)  # At most one alert waiting, overlapping ones are dropped
+    tts_thread = threading.Thread(target=tts_worker, args=(alert_q,), daemon=True)
+    tts_thread.start()
+    
+    # Load YOLOv8 model (will download automatically on first run)
+    print("Loading YOLOv8 object detection model...")
+    model = load_model('yolov8n.pt')  # 'n' for nano (fastest), can use 's', 'm', 'l', 'x' for larger models
+    
+    # Load YOLOv8 pose model for hand/person detection
+    print("Loading YOLOv8 pose estimation model...")
+    pose_model = load_model('yolov8n-pose.pt')  # Detects people and their keypoints including hands
+    
+    # The pose model runs next to the detector in a worker thread.
+    # It is kept (rather than using the detector's person class) for the wrist keypoints.
+    pose_executor = ThreadPoolExecutor(max_workers=1)
+    # Only a PyTorch pose model gets a side stream. A TensorRT engine runs with
+    # execute_v2, which does not wait for preprocessing queued on that stream.
+    pose_stream = None
+    if torch.cuda.is_available() and isinstance(getattr(pose_model, 'model', None), torch.nn.Module):
+        pose_stream = torch.cuda.Stream()
+
+    # Inputs are always INFERENCE_SIZE so cuDNN can cache its plans
+    torch.backends.cudnn.benchmark = True
+    
+    # Warm up before the camera opens, so the first real frame does not wait
+    # on engine deserialization, cuDNN autotuning or lazy initialization
+    print("Warming up models...")
+    dummy = np.zeros((CAPTURE_HEIGHT, CAPTURE_WIDTH, 3), dtype=np.uint8)
+    detect(model, pose_model, [dummy], pose_executor, pose_stream)
+    
+    # Open webcam (0 is default camera, change to 1, 2, etc. if you have multiple cameras)
+    print("Opening webcam...")
+    
+    # Try different camera backends for macOS compatibility
+    cap = None
+    for backend in [cv2.CAP_AVFOUNDATION, cv2.CAP_ANY]:
+        cap = cv2.VideoCapture(0, backend)
+        if cap.isOpened():
+            print(f"Camera opened successfully with backend: {backend}")
+            break
+        cap.release()
+    
+    if cap is None or not cap.isOpened():
+        print("Error: Could not open webcam")
+        print("\nTroubleshooting steps:")
+        print("1. Go to System Settings > Privacy & Security > Camera")
+        print("2. Enable camera access for Terminal/Python")
+        print("3. Close and restart Terminal")
+        print("4. Make sure no other app is using the camera")
+        return
+    
+    # Set camera properties (optional) - some may fail on macOS, that's OK
     try:
-        tts_engine.stop()
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_WIDTH)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_HEIGHT)
+        cap.set(cv2.CAP_PROP_FPS, 30)
     except:
+        pass  # Continue even if setting properties fails
+    
+    # Keep the driver from queueing stale frames, not every backend supports it
+    if not cap.set(cv2.CAP_PROP_BUFFERSIZE, 1):
+        print("Note: Camera backend ignored CAP_PROP_BUFFERSIZE, the grabber thread still drops old frames")
+    
+    print("Starting detection... Press 'q' to quit")
+    
+    # Blocking camera reads and inference run in their own threads,
+    # the event loop (and so imshow) stays on the main thread
+    grabber = FrameGrabber(cap)
+    grabber.start()
+    executors = (ThreadPoolExecutor(max_workers=1), ThreadPoolExecutor(max_workers=1), pose_executor)
+    try:
+        asyncio.run(run_pipeline(grabber, model, pose_model, alert_q, executors, pose_stream))
+    except KeyboardInterrupt:
         pass
+    
+    # Clean up
+    grabber.stop()
+    for executor in executors:
+        executor.shutdown(wait=True)
+    try:
+        alert_q.put(None, timeout=1.0)
+    except queue.Full:
+        pass  # Worker is stuck, it is a daemon thread so exit anyway
+    tts_thread.join(timeout=5.0)
     cap.release()
     cv2.destroyAllWindows()
     print("Detection stopped")